@@ -6,7 +6,12 @@ Leibniz - a naive computer algebra system for usage with Python.
 
 from .base import *
 from .operators import *
+from .rewriting import *
 from .equations import *
 from .functions import *
+from .compiler import *
+from .autodiff import *
+from .optimizer import *
+from .intervals import *
 from .parsing import *
 from .session import *
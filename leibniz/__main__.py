@@ -2,7 +2,15 @@
 Main entry point for interactive usage
 """
 
+import sys
 from .session import repl
 
 if __name__ == "__main__":
-    repl()
+    if sys.argv[1:2] == ["serve"]:
+        from .server import main
+        main(sys.argv[2:])
+    elif sys.argv[1:2] == ["eval"]:
+        from .batch import main
+        main(sys.argv[2:])
+    else:
+        repl()
@@ -0,0 +1,181 @@
+"""
+This module provides numerical algorithmic differentiation directly on the expression tree,
+as opposed to the symbolic differentiation of the expression classes. The Hessian-vector
+product is computed matrix-free by a forward sweep carrying the directional derivative of
+every node, followed by a reverse sweep propagating adjoints together with their directional
+derivatives (forward-over-reverse), at the cost of a small multiple of one evaluation.
+"""
+
+import math
+from .base import Constant, Variable, partial
+from .operators import Plus, Minus, Sum, Times, Product, Divide, Power, UnaryMinus
+from .functions import ScalarFunction, DERIVATIVES
+
+_FUNCTION_DERIVATIVES = {}
+
+def _function_derivatives(function):
+    "Returns compiled first and second derivatives of the scalar function class 'function'"
+    if function not in _FUNCTION_DERIVATIVES:
+        from .compiler import compile_expression                            # pylint: disable=import-outside-toplevel
+        first = DERIVATIVES[function].evaluate_at(Variable("u"))
+        _FUNCTION_DERIVATIVES[function] = (compile_expression(first, ["u"]),
+                                           compile_expression(partial(first, "u"), ["u"]))
+    return _FUNCTION_DERIVATIVES[function]
+
+# Arithmetic on pairs (value, directional derivative)
+
+def _mul(a, b):
+    return a[0] * b[0], a[0] * b[1] + a[1] * b[0]
+
+def _div(a, b):
+    return a[0] / b[0], (a[1] * b[0] - a[0] * b[1]) / b[0] ** 2
+
+def _pow(a, b):
+    if a[0] == 0:
+        # Limits at base 0, where the derivative is infinite for exponents below 1
+        if b[0] == 0:
+            return 1.0, 0.0
+        value = 0.0 if b[0] > 0 else math.inf
+        if a[1] == 0 or b[0] > 1:
+            return value, 0.0
+        if b[0] == 1:
+            return value, a[1]
+        return value, math.copysign(math.inf, b[0] * a[1])
+    value = a[0] ** b[0]
+    if b[1] == 0:
+        if b[0] == 0:
+            return value, 0.0
+        return value, b[0] * a[0] ** (b[0] - 1) * a[1]
+    return value, value * (b[1] * math.log(a[0]) + b[0] * a[1] / a[0])
+
+def _tape(expression):
+    """
+    Flattens 'expression' into a list of its distinct nodes, children before their parents,
+    each along with the indices of its subexpressions in the list
+    """
+    index, tape, stack = {}, [], [(expression, None)]
+    while stack:
+        node, subs = stack.pop()
+        if subs is not None:
+            index[id(node)] = len(tape)
+            tape.append((node, [index[id(sub)] for sub in subs]))
+        elif id(node) not in index:
+            subs = node.subexpressions
+            stack.append((node, subs))
+            stack.extend((sub, None) for sub in reversed(subs) if id(sub) not in index)
+    return tape
+
+def _forward_function(node, args, environment, direction):                 # pylint: disable=unused-argument
+    first, _ = _function_derivatives(node.__class__)
+    return node.__class__.pyfunction(args[0][0]), first(args[0][0]) * args[0][1]
+
+def _forward_product(node, args, environment, direction):                  # pylint: disable=unused-argument
+    result = (1.0, 0.0)
+    for arg in args:
+        result = _mul(result, arg)
+    return result
+
+FORWARD = {
+    Constant: lambda node, args, environment, direction: (node.value, 0.0),
+    Variable: lambda node, args, environment, direction: (environment[node.name],
+                                                          direction.get(node.name, 0.0)),
+    Plus: lambda node, args, environment, direction: (args[0][0] + args[1][0],
+                                                      args[0][1] + args[1][1]),
+    Sum: lambda node, args, environment, direction: (sum(a[0] for a in args),
+                                                     sum(a[1] for a in args)),
+    Minus: lambda node, args, environment, direction: (args[0][0] - args[1][0],
+                                                       args[0][1] - args[1][1]),
+    UnaryMinus: lambda node, args, environment, direction: (-args[0][0], -args[0][1]),
+    Times: _forward_product,
+    Product: _forward_product,
+    Divide: lambda node, args, environment, direction: _div(*args),
+    Power: lambda node, args, environment, direction: _pow(*args),
+    ScalarFunction: _forward_function,
+}
+
+def _partials_product(node, args, value):                                   # pylint: disable=unused-argument
+    prefixes, suffixes = [(1.0, 0.0)], [(1.0, 0.0)]
+    for arg in args[:-1]:
+        prefixes.append(_mul(prefixes[-1], arg))
+    for arg in reversed(args[1:]):
+        suffixes.append(_mul(suffixes[-1], arg))
+    return [_mul(prefix, suffix) for prefix, suffix in zip(prefixes, reversed(suffixes))]
+
+def _partials_divide(node, args, value):                                    # pylint: disable=unused-argument
+    numerator, denominator = args
+    return [_div((1.0, 0.0), denominator),
+            _div((-numerator[0], -numerator[1]), _mul(denominator, denominator))]
+
+def _partials_power(node, args, value):
+    base, exponent = args
+    if exponent[0] == 0 and (exponent[1] == 0 or base[0] == 0):
+        wrt_base = (0.0, 0.0)
+    else:
+        wrt_base = _mul(exponent, _pow(base, (exponent[0] - 1, exponent[1])))
+    if isinstance(node.right, Constant) or base[0] == 0:
+        return [wrt_base, (0.0, 0.0)]
+    return [wrt_base, _mul(value, (math.log(base[0]), base[1] / base[0]))]
+
+def _partials_function(node, args, value):                                  # pylint: disable=unused-argument
+    first, second = _function_derivatives(node.__class__)
+    return [(first(args[0][0]), second(args[0][0]) * args[0][1])]
+
+PARTIALS = {
+    Plus: lambda node, args, value: [(1.0, 0.0), (1.0, 0.0)],
+    Sum: lambda node, args, value: [(1.0, 0.0)] * len(args),
+    Minus: lambda node, args, value: [(1.0, 0.0), (-1.0, 0.0)],
+    UnaryMinus: lambda node, args, value: [(-1.0, 0.0)],
+    Times: _partials_product,
+    Product: _partials_product,
+    Divide: _partials_divide,
+    Power: _partials_power,
+    ScalarFunction: _partials_function,
+}
+
+class HessianVectorProduct:
+    """
+    Matrix-free Hessian-vector product of 'expression' with respect to 'variables'. The
+    expression is flattened once, so repeated products, as in the inner loop of an
+    optimiser, only pay for the two sweeps. Every node type has a rule for its values and
+    directional derivatives in FORWARD and for the partials with respect to its
+    subexpressions, again with their directional derivatives, in PARTIALS.
+    """
+    def __init__(self, expression, variables):
+        self.variables = list(variables)
+        self.tape = []
+        for node, subs in _tape(expression):
+            kind = ScalarFunction if isinstance(node, ScalarFunction) else node.__class__
+            if kind not in FORWARD:
+                raise TypeError(f"Cannot differentiate {kind.__name__}")
+            self.tape.append((node, subs, FORWARD[kind], PARTIALS.get(kind)))
+    def __call__(self, environment, vector):
+        direction = dict(zip(self.variables, vector))
+        pairs = []
+        for node, subs, forward, _ in self.tape:
+            pairs.append(forward(node, [pairs[sub] for sub in subs], environment, direction))
+        adjoints = [None] * len(self.tape)
+        adjoints[-1] = (1.0, 0.0)
+        result = dict.fromkeys(self.variables, 0.0)
+        for position in reversed(range(len(self.tape))):
+            adjoint = adjoints[position]
+            if adjoint is None:
+                continue
+            node, subs, _, partials = self.tape[position]
+            if partials is None:
+                if isinstance(node, Variable) and node.name in result:
+                    result[node.name] += adjoint[1]
+                continue
+            for sub, local in zip(subs, partials(node, [pairs[sub] for sub in subs],
+                                                 pairs[position])):
+                value, tangent = _mul(adjoint, local)
+                previous = adjoints[sub]
+                adjoints[sub] = (value, tangent) if previous is None \
+                                else (previous[0] + value, previous[1] + tangent)
+        return [result[var] for var in self.variables]
+
+def hessian_vector_product(expression, variables, environment, vector):
+    """
+    Returns the product of the Hessian of 'expression' with respect to 'variables' at
+    'environment' with 'vector', without forming the Hessian
+    """
+    return HessianVectorProduct(expression, variables)(environment, vector)
@@ -2,7 +2,6 @@
 This module contains the most basic types of algebraic Leibniz expressions
 """
 
-import collections
 from .formatting import ExpressionFormatter, DotFormatter, ConstantFormatter, VariableFormatter
 
 class Expression(ExpressionFormatter):
@@ -41,7 +40,7 @@ class Expression(ExpressionFormatter):
         subexprs = []
         for sub_name in self.__class__.subexpr_names:
             subexpr = getattr(self, sub_name)
-            if isinstance(subexpr, collections.Iterable):
+            if isinstance(subexpr, (tuple, list)):
                 subexprs += [sub for sub in subexpr]
             else:
                 subexprs.append(subexpr)
@@ -112,7 +111,7 @@ class Variable(VariableFormatter, Expression):
         return environment[self.name]
     @property
     def variables(self):
-        return set(self.name)
+        return {self.name}
     def substitute(self, variable, expression):
         if self == variable:
             return expression
@@ -138,10 +137,16 @@ class Vector(Expression):
     def variables(self):
         return set(var for c in self.components for var in c.variables)
 
-def partial(expression, variable):
+def partial(expression, variable, budget=None):
+    if budget is not None:
+        with budget:
+            return expression.partial(variable).simplify()
     return expression.partial(variable).simplify()
 
-def simplify(expression):
+def simplify(expression, budget=None):
+    if budget is not None:
+        with budget:
+            return expression.simplify()
     return expression.simplify()
 
 def evaluate(expression, environment={}):                                   # pylint: disable=dangerous-default-value
@@ -153,5 +158,89 @@ def gradient(expression, variables, environment=None):
         return partials
     return [partial.evaluate(environment) for partial in partials]
 
-def jacobian(function, variables, environment=None):
-    return [gradient(expr, variables, environment) for expr in function]
+def sparsity_pattern(function, variables):
+    """
+    Returns the structural nonzero pattern of the Jacobian of 'function' as
+    compressed sparse row index arrays (indptr, indices). An entry is
+    structurally zero if the row expression is free of the column variable.
+    """
+    columns = {}
+    for idx, var in enumerate(variables):
+        columns.setdefault(var, []).append(idx)
+    indptr, indices = [0], []
+    for expr in function:
+        indices += sorted(idx for var in expr.variables
+                          for idx in columns.get(var, ()))
+        indptr.append(len(indices))
+    return indptr, indices
+
+class SparseJacobian:
+    """
+    Represents a Jacobian in compressed sparse row format. Only structurally
+    nonzero entries are differentiated; the sparsity pattern and the symbolic
+    partials are kept, so the object can be evaluated repeatedly.
+    """
+    def __init__(self, function, variables, environment=None):
+        function, variables = list(function), list(variables)
+        self.shape = (len(function), len(variables))
+        self.indptr, self.indices = sparsity_pattern(function, variables)
+        self.partials = [partial(function[row], variables[col])
+                         for row, col in zip(self.rows, self.indices)]
+        self.values = self.partials
+        self.numeric = bool(environment)
+        if self.numeric:
+            self.values = self.evaluate(environment)
+    @property
+    def rows(self):
+        "Row indices of the stored entries, as in COO format"
+        return [row for row in range(self.shape[0])
+                for _ in range(self.indptr[row], self.indptr[row + 1])]
+    @property
+    def columns(self):
+        "Column indices of the stored entries, as in COO format"
+        return self.indices
+    @property
+    def nnz(self):
+        return len(self.indices)
+    def evaluate(self, environment={}):                                     # pylint: disable=dangerous-default-value
+        return [entry.evaluate(environment) for entry in self.partials]
+    def todense(self, environment=None):
+        values = self.evaluate(environment) if environment else self.values
+        zero = 0 if environment or self.numeric else Constant(0)
+        dense = [[zero] * self.shape[1] for _ in range(self.shape[0])]
+        for row, col, value in zip(self.rows, self.indices, values):
+            dense[row][col] = value
+        return dense
+
+def hessian(expression, variables, environment=None):
+    """
+    Returns the Hessian of 'expression' with respect to 'variables'. Only the upper
+    triangle is computed, by differentiating the first order partials further, and
+    entries structurally zero are skipped; the lower triangle is filled by symmetry.
+    """
+    variables = list(variables)
+    first = SparseJacobian([expression], variables)
+    matrix = [[Constant(0)] * len(variables) for _ in variables]
+    for row, first_partial in zip(first.indices, first.partials):
+        second = SparseJacobian([first_partial], variables[row:])
+        for col, entry in zip(second.indices, second.partials):
+            matrix[row][row + col] = matrix[row + col][row] = entry
+    if not environment:
+        return matrix
+    values = {}
+    for row in matrix:
+        for entry in row:
+            if id(entry) not in values:
+                values[id(entry)] = entry.evaluate(environment)
+    return [[values[id(entry)] for entry in row] for row in matrix]
+
+def jacobian(function, variables, environment=None, sparse=False):
+    """
+    Returns the Jacobian of 'function' with respect to 'variables', skipping
+    structurally zero entries. If 'sparse' is set, a SparseJacobian is returned
+    instead of nested lists.
+    """
+    matrix = SparseJacobian(function, variables, environment)
+    if sparse:
+        return matrix
+    return matrix.todense()
@@ -0,0 +1,160 @@
+"""
+This module provides batch evaluation of a Leibniz expression over large datasets, as in
+
+    python -m leibniz eval "x^2 * Sin(y)" --input data.csv --output out.csv
+
+The expression is parsed, simplified and compiled once, the input is streamed in chunks of
+a fixed number of rows, so memory usage is bounded independently of the size of the input.
+Input can be CSV with a header row naming the columns or raw float64 binary records, whose
+columns are then named by --columns. If NumPy is available, binary input is memory-mapped and
+every chunk is evaluated vectorized; otherwise rows are evaluated one at a time. Either way,
+rows outside of the domain of the expression yield nan.
+"""
+
+import argparse
+import csv
+import itertools
+import math
+import os
+import sys
+from array import array
+from .compiler import compile_expression
+from .equations import Assertion
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def read_csv(path, variables, chunk_size):
+    """
+    Yields chunks of the columns named by 'variables' from a CSV file with a header row,
+    along with the number of rows in the chunk
+    """
+    with open(path, newline="") as infile:
+        reader = csv.reader(infile)
+        header = next(reader)
+        missing = [var for var in variables if var not in header]
+        if missing:
+            raise ValueError(f"Missing input columns: {', '.join(missing)}")
+        indices = [header.index(var) for var in variables]
+        rows = []
+        for row in reader:
+            rows.append([float(row[idx]) for idx in indices])
+            if len(rows) == chunk_size:
+                yield len(rows), _columns(rows, len(variables))
+                rows = []
+        if rows:
+            yield len(rows), _columns(rows, len(variables))
+
+def _columns(rows, width):
+    if numpy is not None:
+        return list(numpy.array(rows, dtype=numpy.float64).reshape(len(rows), width).T)
+    return [list(column) for column in zip(*rows)]
+
+def read_binary(path, columns, variables, chunk_size):
+    "Yields chunks of the columns named by 'variables' from raw float64 records, see read_csv"
+    missing = [var for var in variables if var not in columns]
+    if missing:
+        raise ValueError(f"Missing input columns: {', '.join(missing)}")
+    indices = [columns.index(var) for var in variables]
+    width = len(columns)
+    size = os.path.getsize(path)
+    if size % (8 * width):
+        raise ValueError(f"Input size of {size} bytes is not a multiple of the record size "
+                         f"of {8 * width} bytes for {width} columns")
+    if numpy is not None:
+        if not size:
+            return
+        data = numpy.memmap(path, dtype=numpy.float64, mode="r").reshape(-1, width)
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            yield len(chunk), [chunk[:, idx] for idx in indices]
+        return
+    with open(path, "rb") as infile:
+        while True:
+            values = array("d")
+            values.frombytes(infile.read(8 * width * chunk_size))
+            if not values:
+                break
+            yield len(values) // width, [values[idx::width] for idx in indices]
+
+def _evaluate_row(function, row):
+    "Evaluates 'function' on a single row, with nan outside of its domain as NumPy does"
+    try:
+        value = function(*row)
+    except (ValueError, ZeroDivisionError, OverflowError):
+        return math.nan
+    return math.nan if isinstance(value, complex) else value
+
+def evaluate_chunks(function, chunks):
+    "Evaluates 'function' on every chunk, vectorized if NumPy is available"
+    for length, chunk in chunks:
+        if numpy is not None:
+            with numpy.errstate(all="ignore"):
+                values = function(*chunk)
+            yield numpy.broadcast_to(values, (length,))
+        elif chunk:
+            yield [_evaluate_row(function, row) for row in zip(*chunk)]
+        else:
+            yield [_evaluate_row(function, ())] * length
+
+def write_csv(outfile, results, name):
+    writer = csv.writer(outfile)
+    writer.writerow([name])
+    for chunk in results:
+        writer.writerows([value] for value in chunk)
+
+def write_binary(outfile, results):
+    for chunk in results:
+        if numpy is not None:
+            numpy.asarray(chunk, dtype=numpy.float64).tofile(outfile)
+        else:
+            array("d", chunk).tofile(outfile)
+
+def main(argv=None):
+    from .parsing import parse                                              # pylint: disable=import-outside-toplevel
+    parser = argparse.ArgumentParser(prog="python -m leibniz eval",
+                                     description="Evaluate an expression over a dataset")
+    parser.add_argument("expression")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", default="-", help="output file, '-' for stdout")
+    parser.add_argument("--format", choices=("csv", "binary"), default="csv",
+                        help="input format")
+    parser.add_argument("--output-format", choices=("csv", "binary"),
+                        help="output format, defaults to the input format")
+    parser.add_argument("--columns", help="comma separated column names of binary input")
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--name", default="result", help="name of the output column")
+    args = parser.parse_args(argv)
+    output_format = args.output_format or args.format
+    expression = parse(args.expression)
+    if isinstance(expression, Assertion):
+        parser.error("expected an expression to evaluate, not an assignment")
+    expression = expression.simplify()
+    variables = sorted(expression.variables)
+    function = compile_expression(expression, variables, vectorized=numpy is not None)
+    if args.format == "binary":
+        if not args.columns:
+            parser.error("--columns is required for binary input")
+        chunks = read_binary(args.input, args.columns.split(","), variables, args.chunk_size)
+    else:
+        chunks = read_csv(args.input, variables, args.chunk_size)
+    # Reading the first chunk reports errors in the input before any output is written
+    try:
+        first = list(itertools.islice(chunks, 1))
+    except (OSError, ValueError) as exception:
+        parser.error(str(exception))
+    chunks = itertools.chain(first, chunks)
+    results = evaluate_chunks(function, chunks)
+    if output_format == "binary":
+        if args.output == "-":
+            write_binary(sys.stdout.buffer, results)
+        else:
+            with open(args.output, "wb") as outfile:
+                write_binary(outfile, results)
+    elif args.output == "-":
+        write_csv(sys.stdout, results, args.name)
+    else:
+        with open(args.output, "w", newline="") as outfile:
+            write_csv(outfile, results, args.name)
@@ -0,0 +1,158 @@
+"""
+This module provides an opt-in persistent cache for simplified and differentiated expressions,
+so that large symbolic results survive process restarts and can be shared between worker
+processes on the same host:
+
+    cache = PersistentCache("~/.cache/leibniz.sqlite")
+    derivative = cache.partial(expression, "x")
+
+Results are stored in an SQLite database, keyed by a stable structural hash of the input
+expression together with the operation, the format version CACHE_VERSION and a fingerprint
+of the registered rewrite rules, so that results of other versions or rules are never
+reused. Expressions are serialized as JSON rather than
+pickled, so reading a cache file never executes code. Once the database exceeds its maximum
+size, the least recently used entries are evicted.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from .base import Constant, Variable, Dot, SparseJacobian
+from .operators import Sum, Product, Plus, Minus, Times, Divide, Power, UnaryMinus
+from .functions import ScalarFunction
+from .rewriting import RULES
+
+# Increment whenever the stored data or the results of the cached operations change
+CACHE_VERSION = 1
+
+NODE_TYPES = {cls.__name__: cls for cls in (Dot, Sum, Product, Plus, Minus, Times, Divide,
+                                             Power, UnaryMinus)}
+NODE_TYPES.update({cls.__name__: cls for cls in ScalarFunction.__subclasses__()})
+
+def to_data(expression):
+    "Converts 'expression' into nested lists suitable for JSON serialization"
+    if isinstance(expression, Constant):
+        return ["Constant", expression.value]
+    if isinstance(expression, Variable):
+        return ["Variable", expression.name]
+    name = expression.__class__.__name__
+    if NODE_TYPES.get(name) is not expression.__class__:
+        raise TypeError(f"Cannot serialize {name}")
+    return [name] + [to_data(sub) for sub in expression.subexpressions]
+
+def from_data(data):
+    "Inverse of to_data"
+    name, arguments = data[0], data[1:]
+    if name == "Constant":
+        return Constant(arguments[0])
+    if name == "Variable":
+        return Variable(arguments[0])
+    return NODE_TYPES[name](*(from_data(argument) for argument in arguments))
+
+def structural_hash(expression, *context):
+    """
+    Returns a hash of the structure of 'expression' and any further JSON serializable
+    'context', which is stable across processes and Python versions
+    """
+    payload = json.dumps([to_data(expression), list(context)], separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class PersistentCache:
+    """
+    SQLite backed cache of simplify, partial, gradient and jacobian results, bounded to
+    'max_size' bytes of serialized results. Every thread uses its own connection.
+    """
+    def __init__(self, path, max_size=256 * 2**20):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+                               "value TEXT, size INTEGER, accessed REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_accessed "
+                               "ON results (accessed)")
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+    def get(self, key):
+        "Returns the deserialized value stored under 'key' or None"
+        with self._connection() as connection:
+            row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE results SET accessed = ? WHERE key = ?",
+                               (time.time(), key))
+        return json.loads(row[0])
+    def put(self, key, value):
+        "Stores the JSON serializable 'value' under 'key', evicting old entries if necessary"
+        value = json.dumps(value, separators=(",", ":"))
+        if len(value) > self.max_size:
+            return
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                               (key, value, len(value), time.time()))
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_size:
+                self._evict(connection, total - self.max_size)
+    def _evict(self, connection, excess):
+        rows = connection.execute("SELECT key, size FROM results ORDER BY accessed")
+        evicted = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM results")
+    def key(self, expression, *context):                                    # pylint: disable=no-self-use
+        "Returns the key of the result of an operation given by 'context' on 'expression'"
+        return structural_hash(expression, CACHE_VERSION, RULES.fingerprint, *context)
+    def _cached(self, key, compute, budget):
+        data = self.get(key)
+        if data is not None:
+            return data
+        data = compute()
+        if budget is None or not budget.exhausted:
+            self.put(key, data)
+        return data
+    def simplify(self, expression, budget=None):
+        from .base import simplify                                          # pylint: disable=import-outside-toplevel
+        key = self.key(expression, "simplify")
+        return from_data(self._cached(key, lambda: to_data(simplify(expression, budget)),
+                                      budget))
+    def partial(self, expression, variable, budget=None):
+        from .base import partial                                           # pylint: disable=import-outside-toplevel
+        key = self.key(expression, "partial", variable)
+        return from_data(self._cached(key, lambda: to_data(partial(expression, variable, budget)),
+                                      budget))
+    def gradient(self, expression, variables, environment=None, budget=None):
+        "Cached gradient, stored sparsely as pairs of column index and partial derivative"
+        variables = list(variables)
+        def compute():
+            matrix = SparseJacobian([expression], variables)
+            return [[col, to_data(entry)] for col, entry in zip(matrix.indices, matrix.partials)]
+        key = self.key(expression, "gradient", variables)
+        if budget is not None:
+            with budget:
+                entries = self._cached(key, compute, budget)
+        else:
+            entries = self._cached(key, compute, budget)
+        partials = [Constant(0)] * len(variables)
+        for col, data in entries:
+            partials[col] = from_data(data)
+        if not environment:
+            return partials
+        return [partial.evaluate(environment) for partial in partials]
+    def jacobian(self, function, variables, environment=None, budget=None):
+        "Cached Jacobian, with every row cached as a gradient"
+        return [self.gradient(expression, variables, environment, budget)
+                for expression in function]
@@ -0,0 +1,182 @@
+"""
+This module compiles Leibniz expressions into plain Python functions. The generated code is a
+flat sequence of assignments, one per distinct subexpression, so that there is no interpretive
+overhead from walking the expression tree. Since expressions are also compiled without
+recursion, there is no limit on their nesting depth. Subexpressions
+occurring several times, also across the entries of a gradient or Jacobian, are computed only
+once (common subexpression elimination). Compiled functions either use the math module or, if
+vectorized, NumPy ufuncs and thus accept whole arrays as arguments.
+"""
+
+import math
+from .base import Constant, Variable, SparseJacobian
+from .operators import BinaryOperator, AbelianCollection, AbelianBinaryOperator, UnaryMinus
+from .functions import ScalarFunction, STANDARD_FUNCTIONS
+
+NUMPY_NAMES = {"atan": "arctan", "atanh": "arctanh", "asin": "arcsin", "acos": "arccos"}
+
+def _namespace(vectorized):
+    namespace = {"inf": math.inf, "nan": math.nan}
+    if vectorized:
+        import numpy                                                        # pylint: disable=import-outside-toplevel
+        namespace.update({f: getattr(numpy, NUMPY_NAMES.get(f, f)) for f in STANDARD_FUNCTIONS})
+    else:
+        namespace.update({f: getattr(math, f) for f in STANDARD_FUNCTIONS})
+    return namespace
+
+class CodeGenerator:
+    """
+    Translates expressions into a sequence of Python assignments. Nodes are numbered by their
+    operation and the names holding their operands, so every structurally equal subexpression
+    is assigned exactly once.
+    """
+    def __init__(self, variables):
+        self.arguments = {var: f"_v{idx}" for idx, var in enumerate(variables)}
+        self.lines = []
+        self.values = {}
+    def assign(self, source, key):
+        if key in self.values:
+            return self.values[key]
+        name = f"_t{len(self.lines)}"
+        self.lines.append(f"{name} = {source}")
+        self.values[key] = name
+        return name
+    def emit(self, expression):
+        """
+        Emits code for 'expression' and returns the name or literal holding its value. The
+        tree is traversed with an explicit stack, so deeply nested expressions do not exhaust
+        the recursion limit.
+        """
+        names, stack = {}, [(expression, None)]
+        while stack:
+            node, subs = stack.pop()
+            if subs is not None:
+                names[id(node)] = self.emit_node(node, [names[id(sub)] for sub in subs])
+            elif id(node) not in names:
+                subs = node.subexpressions
+                stack.append((node, subs))
+                stack.extend((sub, None) for sub in reversed(subs) if id(sub) not in names)
+        return names[id(expression)]
+    def emit_node(self, expression, operands):
+        """
+        Emits code for the root of 'expression', given the names or literals holding the
+        values of its subexpressions, and returns the name or literal holding its value
+        """
+        if isinstance(expression, Constant):
+            return f"({expression.value!r})"
+        if isinstance(expression, Variable):
+            if expression.name not in self.arguments:
+                raise ValueError(f"Variable '{expression.name}' is not an argument")
+            return self.arguments[expression.name]
+        if isinstance(expression, BinaryOperator):
+            source = expression.__class__.py_symbol.join(operands)
+            if isinstance(expression, AbelianBinaryOperator):
+                operands = sorted(operands)
+            return self.assign(source, (expression.__class__.py_symbol, *operands))
+        if isinstance(expression, AbelianCollection):
+            operator = expression.__class__.binaryoperator
+            if not operands:
+                return f"({operator.right_identity.value!r})"
+            return self.assign(operator.py_symbol.join(operands),
+                               (operator.py_symbol, *sorted(operands)))
+        if isinstance(expression, UnaryMinus):
+            return self.assign(f"-{operands[0]}", ("-", operands[0]))
+        if isinstance(expression, ScalarFunction):
+            name = expression.__class__.__name__.lower()
+            return self.assign(f"{name}({operands[0]})", (name, operands[0]))
+        raise TypeError(f"Cannot compile {expression.__class__.__name__}")
+    def function(self, results, vectorized=False, name="_function", parameters=(), prologue=()):
+        "Returns the function computing 'results' from the lines emitted so far"
+        signature = ", ".join(list(self.arguments.values()) + list(parameters))
+        body = "".join(f"    {line}\n" for line in list(prologue) + self.lines)
+        source = f"def {name}({signature}):\n{body}    return {results}\n"
+        namespace = _namespace(vectorized)
+        exec(source, namespace)                                             # pylint: disable=exec-used
+        function = namespace[name]
+        function.source = source
+        return function
+
+def _variables(expression):
+    "Returns the names of the variables in 'expression', traversing it without recursion"
+    names, seen, stack = set(), set(), [expression]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Variable):
+            names.add(node.name)
+        for sub in node.subexpressions:
+            if id(sub) not in seen:
+                seen.add(id(sub))
+                stack.append(sub)
+    return names
+
+def compile_expression(expression, variables=None, vectorized=False):
+    """
+    Compiles 'expression' into a Python function taking the values of 'variables' (by
+    default all variables of the expression in sorted order) as positional arguments.
+    """
+    variables = sorted(_variables(expression)) if variables is None else list(variables)
+    generator = CodeGenerator(variables)
+    function = generator.function(generator.emit(expression), vectorized)
+    try:
+        formula = f"{expression:py}"
+    except RecursionError:
+        formula = "<expression nested too deeply to be shown>"
+    function.__doc__ = f"({', '.join(variables)}) -> {formula}"
+    return function
+
+def _arguments(expressions, variables):
+    extra = set(var for expression in expressions for var in expression.variables)
+    return list(variables) + sorted(extra - set(variables))
+
+def _compile_entries(vector, matrix, variables, shape, use_numpy):
+    """
+    Compiles the structurally nonzero entries of the Jacobian 'matrix' of 'vector' into a
+    function writing them to an array of the given shape
+    """
+    arguments = _arguments(vector, variables)
+    generator = CodeGenerator(arguments)
+    values = [generator.emit(entry) for entry in matrix.partials]
+    if use_numpy is None:
+        try:
+            import numpy                                                    # pylint: disable=import-outside-toplevel, unused-import
+            use_numpy = True
+        except ImportError:
+            use_numpy = False
+    if use_numpy:
+        allocation = f"out = zeros({shape!r})"
+        subscript = "[{0}, {1}]" if len(shape) == 2 else "[{1}]"
+    elif len(shape) == 2:
+        allocation = f"out = [[0.0] * {shape[1]} for _ in range({shape[0]})]"
+        subscript = "[{0}][{1}]"
+    else:
+        allocation = f"out = [0.0] * {shape[0]}"
+        subscript = "[{1}]"
+    generator.lines += [f"out{subscript.format(row, col)} = {value}"
+                        for row, col, value in zip(matrix.rows, matrix.indices, values)]
+    function = generator.function("out", False, "_jacobian", ["out=None"],
+                                  ["if out is None:", f"    {allocation}"])
+    if use_numpy:
+        import numpy                                                        # pylint: disable=import-outside-toplevel, reimported
+        function.__globals__["zeros"] = numpy.zeros
+    function.__doc__ = (f"({', '.join(arguments + ['out=None'])}) -> derivatives with respect to "
+                        f"({', '.join(variables)})")
+    return function
+
+def compile_jacobian(vector, variables, use_numpy=None):
+    """
+    Compiles the Jacobian of the expressions in 'vector' with respect to 'variables' into a
+    single function, sharing common subexpressions across all entries. The function takes
+    the values of 'variables' followed by any other free variables in sorted order, and
+    returns a NumPy array (or nested lists if NumPy is not used). An array 'out' from a
+    previous call can be passed in to be refilled; only structurally nonzero entries are
+    written to it.
+    """
+    vector, variables = list(vector), list(variables)
+    matrix = SparseJacobian(vector, variables)
+    return _compile_entries(vector, matrix, variables, matrix.shape, use_numpy)
+
+def compile_gradient(expression, variables, use_numpy=None):
+    "Compiles the gradient of 'expression' into a single function, see compile_jacobian"
+    variables = list(variables)
+    matrix = SparseJacobian([expression], variables)
+    return _compile_entries([expression], matrix, variables, (len(variables),), use_numpy)
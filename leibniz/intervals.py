@@ -0,0 +1,237 @@
+"""
+This module evaluates expressions in interval arithmetic. Given a box, i.e. an interval
+[lo, hi] for every variable, the result is an interval enclosing every value the expression
+takes on the box, so a function can be bounded over a whole region in a single pass, as
+needed for pruning in branch-and-bound searches:
+
+    >>> interval_evaluate(parse("x * Exp(y)"), {"x": (1, 2), "y": (0, 1)})
+    (0.9999999999999998, 5.436563656918092)
+
+The bounds of every operation are widened outwards by one unit in the last place, which
+accounts for the rounding of the floating point results. As usual in interval arithmetic,
+the enclosures may overestimate the range if a variable occurs several times. Where a box
+exceeds the domain of a function, only the part within the domain is considered, and a box
+entirely outside of it yields (nan, nan). Powers with non-integer or non-constant exponents
+are only defined for non-negative bases.
+
+interval_evaluate_boxes evaluates many boxes at once, vectorized with NumPy if available.
+"""
+
+import math
+from functools import reduce
+from .base import Constant, Variable
+from .operators import Plus, Minus, Times, Divide, Power, Sum, Product, UnaryMinus
+from .functions import ScalarFunction
+from .compiler import NUMPY_NAMES
+
+_LIMITS = {("log", 0.0): -math.inf, ("atanh", 1.0): math.inf, ("atanh", -1.0): -math.inf}
+
+class _Scalar:
+    "Operations on floats, returning infinities or nan instead of raising exceptions"
+    minimum, maximum = staticmethod(min), staticmethod(max)
+    @staticmethod
+    def where(condition, left, right):
+        return left if condition else right
+    @staticmethod
+    def isnan(x):
+        return math.isnan(x)
+    @staticmethod
+    def floor(x):
+        return math.floor(x) if math.isfinite(x) else x
+    @staticmethod
+    def down(x):
+        return math.nextafter(x, -math.inf)
+    @staticmethod
+    def up(x):
+        return math.nextafter(x, math.inf)
+    @staticmethod
+    def divide(x, y):
+        return x / y if y else math.copysign(math.inf, x)
+    @staticmethod
+    def power(x, y):
+        if x == 0 and y < 0:
+            return math.inf
+        try:
+            return math.pow(x, y)
+        except OverflowError:
+            return -math.inf if x < 0 and y % 2 == 1 else math.inf
+        except ValueError:
+            return math.nan
+    @staticmethod
+    def function(name, x):
+        try:
+            return getattr(math, name)(x)
+        except OverflowError:
+            return -math.inf if x < 0 and name != "cosh" else math.inf
+        except ValueError:
+            return _LIMITS.get((name, x), math.nan)
+
+class _Vectorized:
+    "The same operations elementwise on NumPy arrays"
+    def __init__(self, numpy):
+        self.numpy = numpy
+        self.minimum, self.maximum = numpy.minimum, numpy.maximum
+        self.where, self.isnan, self.floor = numpy.where, numpy.isnan, numpy.floor
+        self.divide, self.power = numpy.divide, numpy.power
+    def down(self, x):
+        return self.numpy.nextafter(x, -math.inf)
+    def up(self, x):
+        return self.numpy.nextafter(x, math.inf)
+    def function(self, name, x):
+        return getattr(self.numpy, NUMPY_NAMES.get(name, name))(x)
+
+_SCALAR = _Scalar()
+
+# Monotonic functions with their domains, as (lower, upper, increasing)
+MONOTONIC = {"exp": (-math.inf, math.inf, True), "log": (0.0, math.inf, True),
+             "sqrt": (0.0, math.inf, True), "sinh": (-math.inf, math.inf, True),
+             "tanh": (-math.inf, math.inf, True), "atan": (-math.inf, math.inf, True),
+             "atanh": (-1.0, 1.0, True), "asin": (-1.0, 1.0, True),
+             "acos": (-1.0, 1.0, False)}
+
+def _widen(ops, lo, hi):
+    return ops.down(lo), ops.up(hi)
+
+def _empty(ops, a):
+    return ops.isnan(a[0]) | ops.isnan(a[1])
+
+def _clip(ops, a, lower, upper):
+    "Restricts the interval 'a' to [lower, upper], with nan bounds if they do not intersect"
+    lo, hi = ops.maximum(a[0], lower), ops.minimum(a[1], upper)
+    empty = lo > hi
+    return ops.where(empty, math.nan, lo), ops.where(empty, math.nan, hi)
+
+def _contains(ops, a, point, period):
+    "Whether the interval 'a' contains 'point' plus any multiple of 'period'"
+    return ops.floor((a[1] - point) / period) * period + point >= a[0]
+
+def _add(ops, a, b):
+    return _widen(ops, a[0] + b[0], a[1] + b[1])
+
+def _subtract(ops, a, b):
+    return _widen(ops, a[0] - b[1], a[1] - b[0])
+
+def _multiply(ops, a, b):
+    # 0 * inf counts as 0, since infinite bounds are never attained
+    products = [ops.where((x == 0) | (y == 0), 0.0, x * y) for x in a for y in b]
+    lo, hi = _widen(ops, reduce(ops.minimum, products), reduce(ops.maximum, products))
+    empty = _empty(ops, a) | _empty(ops, b)
+    return ops.where(empty, math.nan, lo), ops.where(empty, math.nan, hi)
+
+def _reciprocal(ops, a):
+    lo, hi = a
+    finite = (lo > 0) | (hi < 0)
+    result = _widen(ops, ops.where(finite | (lo == 0) & (hi > 0), ops.divide(1.0, hi), -math.inf),
+                    ops.where(finite | (hi == 0) & (lo < 0), ops.divide(1.0, lo), math.inf))
+    empty = _empty(ops, a)
+    return ops.where(empty, math.nan, result[0]), ops.where(empty, math.nan, result[1])
+
+def _function(ops, name, a):
+    "Applies the standard function 'name' to the interval 'a'"
+    if name in MONOTONIC:
+        lower, upper, increasing = MONOTONIC[name]
+        lo, hi = _clip(ops, a, lower, upper)
+        if not increasing:
+            lo, hi = hi, lo
+        return _widen(ops, ops.function(name, lo), ops.function(name, hi))
+    at_lo, at_hi = ops.function(name, a[0]), ops.function(name, a[1])
+    if name == "cosh":
+        return _widen(ops, ops.where((a[0] <= 0) & (a[1] >= 0), 1.0, ops.minimum(at_lo, at_hi)),
+                      ops.maximum(at_lo, at_hi))
+    if name == "tan":
+        pole = _contains(ops, a, math.pi / 2, math.pi)
+        return _widen(ops, ops.where(pole, -math.inf, at_lo), ops.where(pole, math.inf, at_hi))
+    if name in ("sin", "cos"):
+        maximum, minimum = (math.pi / 2, -math.pi / 2) if name == "sin" else (0.0, math.pi)
+        lo, hi = _widen(ops, ops.minimum(at_lo, at_hi), ops.maximum(at_lo, at_hi))
+        lo = ops.where(_contains(ops, a, minimum, 2 * math.pi), -1.0, ops.maximum(lo, -1.0))
+        hi = ops.where(_contains(ops, a, maximum, 2 * math.pi), 1.0, ops.minimum(hi, 1.0))
+        return lo, hi
+    raise TypeError(f"No interval extension for '{name}'")
+
+def _power(ops, a, b, exponent=None):
+    """
+    Raises the interval 'a' to the interval 'b', where 'exponent' is the value of 'b' if it
+    is a constant
+    """
+    if exponent is None:
+        return _function(ops, "exp", _multiply(ops, b, _function(ops, "log", a)))
+    if float(exponent).is_integer():
+        power = abs(int(exponent))
+        if power == 0:
+            return (1.0, 1.0)
+        at_lo, at_hi = ops.power(a[0], power), ops.power(a[1], power)
+        if power % 2:
+            result = _widen(ops, at_lo, at_hi)
+        else:
+            lo, hi = _widen(ops, ops.minimum(at_lo, at_hi), ops.maximum(at_lo, at_hi))
+            result = (ops.where((a[0] <= 0) & (a[1] >= 0), 0.0, ops.maximum(lo, 0.0)), hi)
+        return result if exponent > 0 else _reciprocal(ops, result)
+    lo, hi = _clip(ops, a, 0.0, math.inf)
+    if exponent < 0:
+        lo, hi = hi, lo
+    lo, hi = _widen(ops, ops.power(lo, exponent), ops.power(hi, exponent))
+    return ops.maximum(lo, 0.0), hi
+
+def _evaluate(ops, expression, box, memo):
+    if id(expression) in memo:
+        return memo[id(expression)]
+    if isinstance(expression, Constant):
+        result = (float(expression.value), float(expression.value))
+    elif isinstance(expression, Variable):
+        result = box[expression.name]
+    else:
+        args = [_evaluate(ops, sub, box, memo) for sub in expression.subexpressions]
+        if isinstance(expression, (Plus, Sum)):
+            result = reduce(lambda a, b: _add(ops, a, b), args) if args else (0.0, 0.0)
+        elif isinstance(expression, (Times, Product)):
+            result = reduce(lambda a, b: _multiply(ops, a, b), args) if args else (1.0, 1.0)
+        elif isinstance(expression, Minus):
+            result = _subtract(ops, *args)
+        elif isinstance(expression, UnaryMinus):
+            result = (-args[0][1], -args[0][0])
+        elif isinstance(expression, Divide):
+            result = _multiply(ops, args[0], _reciprocal(ops, args[1]))
+        elif isinstance(expression, Power):
+            exponent = None if expression.right.variables else expression.right.evaluate({})
+            result = _power(ops, *args, exponent)
+        elif isinstance(expression, ScalarFunction):
+            result = _function(ops, expression.__class__.pyfunction.__name__, args[0])
+        else:
+            raise TypeError(f"Cannot evaluate {expression.__class__.__name__} on intervals")
+    memo[id(expression)] = result
+    return result
+
+def interval_evaluate(expression, box):
+    """
+    Returns lower and upper bounds of 'expression' on 'box', which maps every variable to a
+    pair of bounds or a single value
+    """
+    box = {var: (float(value[0]), float(value[1])) if isinstance(value, (tuple, list))
+                else (float(value), float(value))
+           for var, value in box.items()}
+    return _evaluate(_SCALAR, expression, box, {})
+
+def interval_evaluate_boxes(expression, boxes):
+    """
+    Evaluates 'expression' on many boxes at once. 'boxes' maps every variable to a pair of
+    sequences of lower and upper bounds, one per box. Returns the sequences of lower and
+    upper bounds of the expression, as NumPy arrays if NumPy is available, otherwise as
+    lists of floats.
+    """
+    try:
+        import numpy                                                        # pylint: disable=import-outside-toplevel
+    except ImportError:
+        count = len(next(iter(boxes.values()))[0]) if boxes else 1
+        bounds = [interval_evaluate(expression, {var: (lows[idx], highs[idx])
+                                                 for var, (lows, highs) in boxes.items()})
+                  for idx in range(count)]
+        return [lo for lo, _ in bounds], [hi for _, hi in bounds]
+    box = {var: (numpy.asarray(lows, dtype=numpy.float64),
+                 numpy.asarray(highs, dtype=numpy.float64))
+           for var, (lows, highs) in boxes.items()}
+    with numpy.errstate(all="ignore"):
+        lo, hi = _evaluate(_Vectorized(numpy), expression, box, {})
+    shape = numpy.broadcast_shapes(*(bound.shape for bounds in box.values() for bound in bounds)) \
+            if box else (1,)
+    return numpy.broadcast_to(lo, shape), numpy.broadcast_to(hi, shape)
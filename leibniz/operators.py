@@ -4,11 +4,15 @@ It handles associativity via casting nested operations to their respective
 collections, i.e. Plus(a, Plus(b, c)) gets cast to Sum(a, b, c) etc.
 """
 
-from operator import add, sub, mul, truediv as div, neg
+from operator import add, sub, mul, truediv as div, neg, is_
 from .base import Expression, Constant
+from .rewriting import RULES, Rule, Wild, exhausted, memoized
 from .formatting import BinaryOperatorFormatter, AbelianCollectionFormatter, UnaryMinusFormatter, \
                         DivisionFormatter, PowerFormatter
 
+# Products with more factors depending on the variable are differentiated in linear size
+WIDE_PRODUCT = 8
+
 class BinaryOperator(BinaryOperatorFormatter, Expression):
     "Base class for binary operators"
     subexpr_names = ("left", "right")
@@ -19,25 +23,18 @@ class BinaryOperator(BinaryOperatorFormatter, Expression):
     def __init__(self, left, right):
         self.left = left
         self.right = right
+    @property
+    def subexpressions(self):
+        return [self.left, self.right]
+    @memoized
     def simplify(self):
-        self.left = self.left.simplify()
-        self.right = self.right.simplify()
-        if isinstance(self.left, Constant) and isinstance(self.right, Constant):
-            return Constant(self.__class__.pyoperator(self.left.value,      # pylint: disable=no-member
-                                                      self.right.value))
-        if self.__class__.left_identity:
-            if self.left == self.__class__.left_identity:
-                return self.right
-        if self.__class__.right_identity:
-            if self.right == self.__class__.right_identity:
-                return self.left
-        if self.__class__.left_null:
-            if self.left == self.__class__.left_null:
-                return self.__class__.left_null
-        if self.__class__.right_null:
-            if self.right == self.__class__.right_null:
-                return self.__class__.right_null
-        return self.__class__(self.left, self.right)
+        left, right = self.left.simplify(), self.right.simplify()
+        if left is self.left and right is self.right:
+            return self._simplify_root(self)
+        return self._simplify_root(self.__class__(left, right))
+    def _simplify_root(self, expression):                                   # pylint: disable=no-self-use
+        "Simplifies 'expression', whose operands are simplified already"
+        return RULES.apply(expression)
     def evaluate(self, environment={}):                                     # pylint: disable=dangerous-default-value
         left = self.left.evaluate(environment)
         right = self.right.evaluate(environment)
@@ -54,6 +51,9 @@ class AbelianCollection(AbelianCollectionFormatter, Expression):
     subexpr_names = ("terms",)
     def __init__(self, *terms):
         self.terms = terms
+    @property
+    def subexpressions(self):
+        return list(self.terms)
     def evaluate(self, environment={}):                                     # pylint: disable=dangerous-default-value
         operator = self.__class__.binaryoperator                            # pylint: disable=no-member
         if not self.terms:
@@ -71,16 +71,19 @@ class AbelianCollection(AbelianCollectionFormatter, Expression):
         return left
     def sort(self):
         from .sorting import _sort_key                                      # pylint: disable=import-outside-toplevel
-        self.terms = sorted([t.sort() for t in self.terms], key=_sort_key)
-        return self
+        terms = sorted([t.sort() for t in self.terms], key=_sort_key)
+        return self._unchanged(terms) or self.__class__(*terms)
+    @memoized
     def simplify(self):
-        self.sort()
         operator = self.__class__.binaryoperator                            # pylint: disable=no-member
-        terms = [term.simplify() for term in self.terms]
-        if len(terms) == 1:
-            return terms[0]
-        if len(terms) == 0:
-            return operator.left_identity
+        # Sorting depends only on the classes of the terms, and every term sorts its own
+        # subexpressions as it is simplified, so sorting this level only suffices
+        from .sorting import _sort_key                                      # pylint: disable=import-outside-toplevel
+        terms = [term.simplify() for term in sorted(self.terms, key=_sort_key)]
+        collection = self._unchanged(terms) or self.__class__(*terms)
+        rewritten = RULES.apply(collection)
+        if rewritten is not collection:
+            return rewritten
         inner = [term for term in terms if isinstance(term, self.__class__)]
         terms = [inner_term for term in inner for inner_term in term.terms] \
                 + [term for term in terms if term not in inner]
@@ -92,7 +95,8 @@ class AbelianCollection(AbelianCollectionFormatter, Expression):
         constants = [t for t in terms if isinstance(t, Constant)]
         variable_terms = [t for t in terms if not isinstance(t, Constant)]
         if constants:
-            constant = Constant(self.__class__(*constants).evaluate())
+            constant = constants[0] if len(constants) == 1 \
+                       else Constant(self.__class__(*constants).evaluate())
             expression = self.__class__(*([constant] + variable_terms))
             if operator.left_null:
                 if constant == operator.left_null:
@@ -104,14 +108,22 @@ class AbelianCollection(AbelianCollectionFormatter, Expression):
             expression = self.__class__(*variable_terms)
         if denominators:
             denominator = self.__class__(*denominators).simplify()
-            expression = operator.inverse(expression, denominator)
-        return expression
+            return operator.inverse(expression, denominator)
+        return self._unchanged(expression.terms) or expression
+    def _unchanged(self, terms):
+        """
+        Returns self if 'terms' are its own terms, so that simplified expressions are
+        recognized as such when they are simplified again, otherwise None
+        """
+        if len(terms) == len(self.terms) and all(map(is_, terms, self.terms)):
+            return self
+        return None
 
 class AbelianBinaryOperator(BinaryOperator):
     "Base class for abelian binary operations"
-    def simplify(self):
-        simplified = super().simplify()
-        if isinstance(simplified, AbelianBinaryOperator):
+    def _simplify_root(self, expression):
+        simplified = RULES.apply(expression)
+        if isinstance(simplified, AbelianBinaryOperator) and not exhausted():
             return simplified.collect().simplify()
         return simplified
     def collect(self):
@@ -141,12 +153,52 @@ class Sum(AbelianCollection):
         return Sum(*(term.partial(variable) for term in self.terms)).simplify()
 
 class Product(AbelianCollection):
-    "It is what it says on the tin"
+    """
+    It is what it says on the tin. Differentiation factors out the terms free of the
+    variable and applies the product rule only among the remaining ones, treating all
+    exponential factors as one, whose logarithmic derivative is the sum of their arguments'
+    derivatives. If more than WIDE_PRODUCT factors remain, the derivative is returned as
+    nested binary operators sharing the partial products, see _product_rule, instead of
+    as a sum of products of all but one factor, which has quadratic size.
+    """
     def partial(self, variable):
-        return Sum(*(Product(*(term if idx != p_idx else p.partial(variable)
-                               for (idx, term) in enumerate(self.terms)))
-                     for (p_idx, p) in enumerate(self.terms))
-                   ).simplify()
+        from .functions import Exp                                          # pylint: disable=no-name-in-module
+        constants, factors, exponentials = [], [], []
+        for term in self.terms:
+            if variable is not None and term.free_of(variable):
+                constants.append(term)
+            elif isinstance(term, Exp):
+                exponentials.append(term)
+            else:
+                factors.append(term)
+        derivatives = [factor.partial(variable) for factor in factors]
+        if exponentials:
+            factors.append(Product(*exponentials))
+            derivatives.append(Product(Sum(*(e.argument.partial(variable) for e in exponentials)),
+                                       *exponentials))
+        if not factors:
+            return Constant(0)
+        if len(factors) > WIDE_PRODUCT:
+            derivatives = [derivative.simplify() for derivative in derivatives]
+            return Product(*constants, _product_rule(factors, derivatives))
+        terms = []
+        for p_idx, derivative in enumerate(derivatives):
+            if exhausted():
+                return Product(*constants, _product_rule(factors, derivatives))
+            terms.append(Product(*(factor if idx != p_idx else derivative
+                                   for (idx, factor) in enumerate(factors))))
+        return Product(*constants, Sum(*terms)).simplify()
+
+def _product_rule(factors, derivatives):
+    """
+    Returns the derivative of the product of 'factors' as (f g)' = f' g + f g', nested from
+    the right. The partial products are shared, so the result has linear size in memory.
+    """
+    product, result = factors[-1], derivatives[-1]
+    for factor, derivative in zip(reversed(factors[:-1]), reversed(derivatives[:-1])):
+        result = Plus(Times(derivative, product), Times(factor, result))
+        product = Times(factor, product)
+    return result
 
 class Plus(AbelianBinaryOperator):
     "It is what it says on the tin"
@@ -172,13 +224,6 @@ class Minus(BinaryOperator):
     def partial(self, variable):
         return Minus(self.left.partial(variable),
                      self.right.partial(variable)).simplify()
-    def simplify(self):
-        simplified = super().simplify()
-        if not isinstance(simplified, Minus):
-            return simplified
-        if simplified.left == Constant(0):
-            return Times(Constant(-1), simplified.right)
-        return simplified
 
 Plus.inverse = Minus
 
@@ -188,16 +233,18 @@ class UnaryMinus(UnaryMinusFormatter, Expression):
     pyoperator = neg
     def __init__(self, expression):
         self.expression = expression
+    @property
+    def subexpressions(self):
+        return [self.expression]
     def partial(self, variable):
         return UnaryMinus(self.expression.partial(variable)).simplify()
     def evaluate(self, environment):
         return -self.expression.evaluate(environment)
     def evaluate_at(self, expression):
         return UnaryMinus(self.expression.evaluate_at(expression))
+    @memoized
     def simplify(self):
-        if isinstance(self.expression, UnaryMinus):
-            return self.expression
-        return Times(Constant(-1), self.expression).simplify()
+        return RULES.apply(self)
 
 class Times(AbelianBinaryOperator):
     "It is what it says on the tin"
@@ -224,23 +271,6 @@ class Divide(DivisionFormatter, BinaryOperator):
     right_identity = Constant(1)
     left_null = Constant(0)
     inverse = Times
-    def simplify(self):
-        simplified = super().simplify()
-        if not isinstance(simplified, Divide):
-            return simplified
-        numerators, denominators = [], []
-        if isinstance(simplified.left, Divide):
-            numerators.append(simplified.left.left)
-            denominators.append(simplified.left.right)
-        else:
-            numerators.append(simplified.left)
-        if isinstance(simplified.right, Divide):
-            numerators.append(simplified.right.right)
-            denominators.append(simplified.right.left)
-        else:
-            denominators.append(simplified.right)
-        return Divide(Product(*numerators).simplify(),
-                      Product(*denominators).simplify())
     def partial(self, variable):
         uprime = self.left.partial(variable)
         vprime = self.right.partial(variable)
@@ -257,34 +287,67 @@ class Power(PowerFormatter, BinaryOperator):
     pyoperator = pow
     right_identity = Constant(1)
     left_null = Constant(0)
-    def simplify(self):
-        simplified = super().simplify()
-        if not isinstance(simplified, Power):
-            return simplified
-        if simplified.right == Constant(0):
-            return Constant(1)
-        if simplified.left == Constant(1):
-            return Constant(1)
-        if simplified.left == Constant(0):
-            return Constant(0)
-        return simplified
     def partial(self, variable):
         from .functions import Ln                                           # pylint: disable=no-name-in-module
-        self.right = self.right.simplify()
-        self.left = self.left.simplify()
-        if self.right.free_of(variable):
-            return Product(self.right,
-                           self.left.partial(variable),
-                           Power(self.left, Minus(self.right, Constant(1)))
+        left, right = self.left.simplify(), self.right.simplify()
+        if right.free_of(variable):
+            return Product(right,
+                           left.partial(variable),
+                           Power(left, Minus(right, Constant(1)))
                            ).simplify()
-        if self.left.free_of(variable):
-            uprime = self.right.partial(variable)
-            return Times(Times(Ln(self.left), uprime), self).simplify()
-        uprime = self.left.partial(variable)
-        vprime = self.right.partial(variable)
-        return Times(Plus(Divide(Times(self.right, uprime), self.left),
-                          Times(Ln(self.left), vprime)),
-                     self).simplify()
+        if left.free_of(variable):
+            uprime = right.partial(variable)
+            return Times(Times(Ln(left), uprime), Power(left, right)).simplify()
+        uprime = left.partial(variable)
+        vprime = right.partial(variable)
+        return Times(Plus(Divide(Times(right, uprime), left),
+                          Times(Ln(left), vprime)),
+                     Power(left, right)).simplify()
+
+def _fold_constants(expression, a, b):
+    return Constant(expression.__class__.pyoperator(a.value, b.value))
+
+def _merge_fractions(expression, x, y):
+    numerators, denominators = [], []
+    if isinstance(x, Divide):
+        numerators.append(x.left)
+        denominators.append(x.right)
+    else:
+        numerators.append(x)
+    if isinstance(y, Divide):
+        numerators.append(y.right)
+        denominators.append(y.left)
+    else:
+        denominators.append(y)
+    numerator, denominator = Product(*numerators).simplify(), Product(*denominators).simplify()
+    if numerator is x and denominator is y:
+        return expression
+    return Divide(numerator, denominator)
+
+def _register_rules():
+    x, a, b = Wild("x"), Wild("a", Constant), Wild("b", Constant)
+    RULES.register(Rule(BinaryOperator, (a, b), _fold_constants))
+    for operator in (Plus, Minus, Times, Divide, Power):
+        if operator.left_identity:
+            RULES.register(Rule(operator, (operator.left_identity, x), x))
+        if operator.right_identity:
+            RULES.register(Rule(operator, (x, operator.right_identity), x))
+        if operator.left_null:
+            RULES.register(Rule(operator, (operator.left_null, x), operator.left_null))
+        if operator.right_null:
+            RULES.register(Rule(operator, (x, operator.right_null), operator.right_null))
+    RULES.register(Rule(Minus, (Constant(0), x), Times(Constant(-1), x)))
+    RULES.register(Rule(Divide, (x, Wild("y")), _merge_fractions))
+    RULES.register(Rule(Power, (x, Constant(0)), Constant(1)))
+    RULES.register(Rule(Power, (Constant(1), x), Constant(1)))
+    RULES.register(Rule(UnaryMinus, (UnaryMinus(x),), lambda expression, x: x.simplify()))
+    RULES.register(Rule(UnaryMinus, (x,),
+                        lambda expression, x: Times(Constant(-1), x).simplify()))
+    RULES.register(Rule(AbelianCollection, (x,), x))
+    RULES.register(Rule(AbelianCollection, (),
+                        lambda expression: expression.binaryoperator.left_identity))
+
+_register_rules()
 
 PRECEDENCE = {Plus: 0,
               Minus: 0,
@@ -0,0 +1,223 @@
+"""
+This module rewrites expressions into equivalent forms which are cheaper to evaluate, as
+opposed to simplify, which aims at a tidy canonical form. What is cheaper is decided by an
+explicit cost model, COSTS, assigning a cost to every operation:
+
+    >>> cost(parse("3*x^3 + 2*x^2 + x + 1"))
+    13
+    >>> optimize(parse("3*x^3 + 2*x^2 + x + 1"))
+    1.0 + x * (1.0 + x * (3.0 * x + 2.0))
+
+Every sum is flattened into signed terms and every term into a product of powers of its
+factors, with denominators as negative powers. Common factors are then pulled out of the
+terms greedily, which amounts to Horner's scheme for polynomials, and each term is rebuilt
+with a single division and small integer powers expanded into multiplications, whenever
+this lowers the cost. Only constant factors cancel and no division by a non-constant is
+dropped, so the result is undefined wherever the original expression is. The result consists of binary operators only, so evaluate does not
+need to restructure collections on every call.
+"""
+
+from .base import Constant
+from .operators import Plus, Minus, Times, Divide, Power, Sum, Product, UnaryMinus, \
+                       BinaryOperator, AbelianCollection
+from .functions import ScalarFunction
+from .rewriting import structural_key, rebuild
+
+COSTS = {Plus: 1, Minus: 1, Times: 1, Divide: 2, Power: 4, UnaryMinus: 1, ScalarFunction: 8}
+
+def _operation_cost(expression, costs):
+    if isinstance(expression, ScalarFunction):
+        return costs[ScalarFunction]
+    if isinstance(expression, AbelianCollection):
+        return max(len(expression.terms) - 1, 0) * costs[expression.binaryoperator]
+    return costs.get(expression.__class__, 0)
+
+def cost(expression, costs=COSTS):                                          # pylint: disable=dangerous-default-value
+    """
+    Returns the cost of evaluating 'expression' as a tree, i.e. counting repeated
+    subexpressions as often as they occur
+    """
+    return _operation_cost(expression, costs) + sum(cost(sub, costs)
+                                                    for sub in expression.subexpressions)
+
+def _integer(expression):
+    "Returns the value of 'expression' if it is an integer constant, otherwise None"
+    if isinstance(expression, Constant) and isinstance(expression.value, (int, float)) \
+            and float(expression.value).is_integer():
+        return int(expression.value)
+    return None
+
+def _terms(expression, sign, terms, memo, costs):
+    "Appends the signed terms of the sum 'expression' to 'terms'"
+    if isinstance(expression, Sum):
+        for term in expression.terms:
+            _terms(term, sign, terms, memo, costs)
+    elif isinstance(expression, (Plus, Minus)):
+        _terms(expression.left, sign, terms, memo, costs)
+        sign = -sign if isinstance(expression, Minus) else sign
+        _terms(expression.right, sign, terms, memo, costs)
+    elif isinstance(expression, UnaryMinus):
+        _terms(expression.expression, -sign, terms, memo, costs)
+    else:
+        factors = {}
+        sign *= _factors(expression, 1, factors, memo, costs)
+        terms.append((sign, factors))
+
+def _factors(expression, exponent, factors, memo, costs, inverted=False):
+    """
+    Collects the factors of 'expression' raised to 'exponent' into 'factors', a dictionary
+    mapping keys as returned by _key to pairs of base and exponent, and returns the sign of
+    'expression'. Within a divisor, as told by 'inverted', divisions by non-constants are
+    kept as factors, since moving their divisors to the numerator would drop the division.
+    """
+    if isinstance(expression, Product):
+        sign = 1
+        for term in expression.terms:
+            sign *= _factors(term, exponent, factors, memo, costs, inverted)
+        return sign
+    if isinstance(expression, Times):
+        return _factors(expression.left, exponent, factors, memo, costs, inverted) \
+               * _factors(expression.right, exponent, factors, memo, costs, inverted)
+    if isinstance(expression, Divide) \
+            and (not inverted or isinstance(expression.right, Constant)):
+        return _factors(expression.left, exponent, factors, memo, costs, inverted) \
+               * _factors(expression.right, -exponent, factors, memo, costs, True)
+    if isinstance(expression, UnaryMinus):
+        return -_factors(expression.expression, exponent, factors, memo, costs, inverted)
+    power = _integer(expression.right) if isinstance(expression, Power) else None
+    if power == 0 and isinstance(expression.left, Constant):
+        return 1
+    if power and (power > 0 or not inverted):
+        sign = _factors(expression.left, exponent * power, factors, memo, costs,
+                        inverted or power < 0)
+        return sign if power % 2 else 1
+    sign = 1
+    if isinstance(expression, Constant) and isinstance(expression.value, (int, float)):
+        if expression.value < 0:
+            sign, expression = -1, Constant(-expression.value)
+        if expression.value == 1:
+            return sign
+    if isinstance(expression, (Divide, Power)):
+        # Kept as is, like x^0, which is undefined where x is
+        base = rebuild(expression, [_optimize(sub, memo, costs)
+                                    for sub in expression.subexpressions])
+    else:
+        base = _optimize(expression, memo, costs)
+    key = _key(base, exponent)
+    factors[key] = (base, factors[key][1] + exponent if key in factors else exponent)
+    return sign
+
+def _key(base, exponent):
+    """
+    Returns the key of 'base' among the factors of a term. Non-constant factors in the
+    numerator and the denominator are kept apart, so that they do not cancel, which would
+    extend the domain, e.g. of x / x to x = 0.
+    """
+    if isinstance(base, Constant):
+        return structural_key(base)
+    return structural_key(base), exponent > 0
+
+def _chain(operator, operands):
+    result = operands[0]
+    for operand in operands[1:]:
+        result = operator(result, operand)
+    return result
+
+def _power(base, power, costs):
+    "Returns 'base' raised to the positive integer 'power', expanded if this is cheaper"
+    if power == 1:
+        return base
+    base_cost = cost(base, costs)
+    if (power - 1) * costs[Times] + power * base_cost < costs[Power] + base_cost:
+        return _chain(Times, [base] * power)
+    return Power(base, Constant(float(power)))
+
+def _product(factors, costs):
+    "Builds the product of 'factors' with at most one division"
+    coefficients = [1.0, 1.0]
+    numerators, denominators = [], []
+    for base, exponent in factors.values():
+        if exponent == 0:
+            continue
+        if isinstance(base, Constant):
+            coefficients[exponent < 0] *= base.value ** abs(exponent)
+        elif exponent > 0:
+            numerators.append(_power(base, exponent, costs))
+        else:
+            denominators.append(_power(base, -exponent, costs))
+    if coefficients[0] != 1 or not numerators:
+        numerators.insert(0, Constant(coefficients[0]))
+    if coefficients[1] != 1:
+        denominators.insert(0, Constant(coefficients[1]))
+    if denominators:
+        return Divide(_chain(Times, numerators), _chain(Times, denominators))
+    return _chain(Times, numerators)
+
+def _sum(terms, costs):
+    "Builds the sum of the signed 'terms', subtracting the negative ones"
+    positive = [_product(factors, costs) for sign, factors in terms if sign > 0]
+    negative = [_product(factors, costs) for sign, factors in terms if sign < 0]
+    if not positive:
+        if not negative:
+            return Constant(0)
+        positive, negative = [UnaryMinus(negative[0])], negative[1:]
+    return _chain(Minus, [_chain(Plus, positive)] + negative)
+
+def _collect(terms, costs):
+    """
+    Builds the sum of 'terms', pulling out the factor common to most terms if this lowers
+    the cost and repeating this on both the factored and the remaining terms
+    """
+    occurrences = {}
+    for idx, (_, factors) in enumerate(terms):
+        for key, (_, exponent) in factors.items():
+            if exponent:
+                occurrences.setdefault((key, exponent > 0), []).append(idx)
+    plain = _sum(terms, costs)
+    if not occurrences:
+        return plain
+    (key, positive), indices = max(occurrences.items(), key=lambda item: len(item[1]))
+    if len(indices) < 2:
+        return plain
+    base = terms[indices[0]][1][key][0]
+    exponent = min(abs(terms[idx][1][key][1]) for idx in indices) * (1 if positive else -1)
+    inner = []
+    for idx in indices:
+        sign, factors = terms[idx]
+        factors = dict(factors)
+        factors[key] = (base, factors[key][1] - exponent)
+        inner.append((sign, factors))
+    inner = _collect(inner, costs)
+    factors = {key: (base, exponent)}
+    inner_key = _key(inner, 1)
+    factors[inner_key] = (inner, factors[inner_key][1] + 1 if inner_key in factors else 1)
+    factored = (1, factors)
+    rest = [term for idx, term in enumerate(terms) if idx not in indices] + [factored]
+    collected = _collect(rest, costs)
+    return collected if cost(collected, costs) < cost(plain, costs) else plain
+
+def _optimize(expression, memo, costs):
+    if id(expression) in memo:
+        return memo[id(expression)][1]
+    if isinstance(expression, (Sum, Product, Plus, Minus, Times, Divide, UnaryMinus)) \
+            or isinstance(expression, Power) and _integer(expression.right) is not None:
+        terms = []
+        _terms(expression, 1, terms, memo, costs)
+        result = _collect(terms, costs)
+    elif isinstance(expression, (BinaryOperator, ScalarFunction)):
+        result = rebuild(expression, [_optimize(sub, memo, costs)
+                                      for sub in expression.subexpressions])
+    else:
+        result = expression
+    memo[id(expression)] = (expression, result)
+    return result
+
+def optimize(expression, costs=COSTS):                                      # pylint: disable=dangerous-default-value
+    """
+    Returns an expression equivalent to 'expression' which is cheaper to evaluate according
+    to 'costs', or 'expression' itself if no cheaper form is found. Since the rewriting uses
+    the laws of real arithmetic, results may differ in the last digits from those of the
+    original expression.
+    """
+    optimized = _optimize(expression, {}, costs)
+    return optimized if cost(optimized, costs) < cost(expression, costs) else expression
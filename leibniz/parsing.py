@@ -2,6 +2,7 @@
 This module provides a REPL to interact with Leibniz functionality.
 """
 
+import threading
 from lark import Lark, Transformer, v_args
 from .functions import *                                                    # pylint: disable=unused-wildcard-import, wildcard-import
 from .base import Constant, Variable
@@ -60,7 +61,7 @@ class LeibnizTree(Transformer):
         super().__init__()
         self.session = session
     def var_assign(self, variable, value):                                  # pylint: disable=no-self-use
-        self.session.vars[variable.name] = value
+        self.session.vars()[variable.name] = value
         return Assertion(variable, value)
     def number(self, value):                                                # pylint: disable=no-self-use
         return Constant(float(value))
@@ -77,6 +78,33 @@ class LeibnizTree(Transformer):
     def cmd(self, cmd):
         getattr(self.session, cmd)()
 
+_TREE_PARSER = None
+_TREE_PARSER_LOCK = threading.Lock()
+
+def tree_parser():
+    "Returns the shared parser producing bare parse trees, which is safe to use from any thread"
+    global _TREE_PARSER                                                     # pylint: disable=global-statement
+    with _TREE_PARSER_LOCK:
+        if _TREE_PARSER is None:
+            _TREE_PARSER = Lark(_GRAMMAR, parser='lalr', start="start", debug=DEBUG)
+    return _TREE_PARSER
+
+class Parser:
+    """
+    Parser bound to its own session, independent of the module level SESSION. Any number of
+    parsers can be used concurrently; they share the grammar but not the session state.
+    Session commands are rejected unless 'commands' is set.
+    """
+    def __init__(self, session=None, commands=True):
+        self.session = Session() if session is None else session
+        self.commands = commands
+        self.transformer = LeibnizTree(self.session)
+    def parse(self, text):
+        tree = tree_parser().parse(text)
+        if not self.commands and getattr(tree, "data", None) == "cmd":
+            raise ValueError("Session commands are not available")
+        return self.transformer.transform(tree)
+
 SESSION = Session()
 PARSER = Lark(_GRAMMAR, parser='lalr', start="start", transformer=LeibnizTree(SESSION), debug=DEBUG)
 parse = PARSER.parse
@@ -0,0 +1,343 @@
+"""
+This module contains a small declarative rewrite-rule engine. Rules consist of a head class,
+a tuple of argument patterns possibly containing pattern variables (Wild) and a replacement,
+which is either a template expression or a callable. Rules are indexed by head class and
+arity, so that only the rules applicable to a given node are ever tried.
+
+The simplification logic of the built-in operators is expressed as rules registered with
+the global rule set RULES, which users can extend with their own identities, e.g.
+
+    X = Wild("X")
+    RULES.register(Rule(Ln, (Exp(X),), X))
+
+The rules are applied by simplify, bottom-up: every node first simplifies its subexpressions
+and then tries the rules at its root. Sums and products of more than two terms are flattened
+into Sum and Product nodes with sorted terms, so rules for Plus and Times only apply to two
+terms, e.g. a rule X*X -> X^2 rewrites x*x but not x*x*y. Rules for Sum and Product, with
+arguments None to match any number of terms, see the flattened terms instead.
+
+The amount of rewriting can be bounded by a Budget. Within one call of simplify, every node
+is simplified only once, even if it occurs several times in the expression tree, as is
+common for derivatives.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+import types
+from contextvars import ContextVar
+from .base import Expression, Constant, Variable, Dot
+
+_BUDGET = ContextVar("budget", default=None)
+_SIMPLIFIED = ContextVar("simplified", default=None)
+
+class Budget:
+    """
+    Bounds the work done by simplification, e.g. within simplify() and partial(). Once the
+    number of rewrite steps, the number of visited nodes or the wall-clock time in seconds
+    exceeds its limit, no further rules are applied and simplification returns subexpressions
+    as they are, so the operation finishes with the partially simplified expression found so
+    far. Differentiation then builds the remaining derivatives unsimplified, in a compact form
+    where the product rule would otherwise take quadratic size. The reason for stopping
+    ("steps", "nodes" or "deadline") is then available as 'reason'. The clock starts on first
+    use.
+    """
+    def __init__(self, max_steps=None, max_nodes=None, timeout=None):
+        self.max_steps = max_steps
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.deadline = None
+        self.steps = 0
+        self.nodes = 0
+        self.reason = None
+        self._tokens = []
+    def __enter__(self):
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+        self._tokens.append(_BUDGET.set(self))
+        return self
+    def __exit__(self, *exc_info):
+        _BUDGET.reset(self._tokens.pop())
+    @property
+    def exhausted(self):
+        return self.reason is not None
+    def visit(self):
+        "Accounts for a visited node; returns False if the budget is exhausted"
+        if self.reason:
+            return False
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            self.reason = "nodes"
+        elif self.max_steps is not None and self.steps >= self.max_steps:
+            self.reason = "steps"
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            self.reason = "deadline"
+        return self.reason is None
+
+def exhausted():
+    "Returns True if the currently active budget is exhausted, including by its deadline"
+    budget = _BUDGET.get()
+    if budget is None:
+        return False
+    if budget.reason is None and budget.deadline is not None \
+            and time.monotonic() > budget.deadline:
+        budget.reason = "deadline"
+    return budget.reason is not None
+
+def memoized(simplify):
+    """
+    Decorates a simplify method, so that the results are memoized by node for the duration
+    of the outermost call of simplify. Once the budget is exhausted, nodes not simplified
+    yet are returned as they are.
+    """
+    @functools.wraps(simplify)
+    def wrapper(self):
+        memo = _SIMPLIFIED.get()
+        if memo is None:
+            token = _SIMPLIFIED.set({})
+            try:
+                return wrapper(self)
+            finally:
+                _SIMPLIFIED.reset(token)
+        entry = memo.get(id(self))
+        if entry is None:
+            budget = _BUDGET.get()
+            if budget is not None and budget.reason is not None:
+                return self
+            # The node is stored along with the result, so its id cannot be reused
+            entry = memo[id(self)] = (self, simplify(self))
+        return entry[1]
+    return wrapper
+
+class Wild(Expression):
+    "Pattern variable matching any expression, optionally restricted to instances of 'kind'"
+    def __init__(self, name, kind=None):
+        self.name = name
+        self.kind = kind
+    def __str__(self):
+        return f"_{self.name}"
+    def rawformat(self):
+        return f"Wild('{self.name}')"
+
+def structural_key(expression):
+    "Returns a hashable key which is equal for structurally equal expressions"
+    if isinstance(expression, Constant):
+        return (Constant, expression.value)
+    if isinstance(expression, Variable):
+        return (Variable, expression.name)
+    if isinstance(expression, Wild):
+        return (Wild, expression.name)
+    subexpressions = expression.subexpressions
+    if not subexpressions and not isinstance(expression, Dot):
+        return (expression.__class__, id(expression))
+    return (expression.__class__,) + tuple(structural_key(sub) for sub in subexpressions)
+
+def rebuild(expression, subexpressions):
+    "Creates a node of the same type as 'expression' with the given subexpressions"
+    if all(new is old for new, old in zip(subexpressions, expression.subexpressions)):
+        return expression
+    return expression.__class__(*subexpressions)
+
+def match(pattern, expression, bindings):
+    """
+    Matches 'expression' against 'pattern', extending 'bindings' by the values of the
+    pattern variables. Returns the bindings or None if there is no match.
+    """
+    if isinstance(pattern, Wild):
+        if pattern.kind and not isinstance(expression, pattern.kind):
+            return None
+        if pattern.name in bindings:
+            if structural_key(bindings[pattern.name]) != structural_key(expression):
+                return None
+            return bindings
+        bindings[pattern.name] = expression
+        return bindings
+    if isinstance(pattern, Dot):
+        return bindings if isinstance(expression, Dot) else None
+    if isinstance(pattern, (Constant, Variable)):
+        return bindings if pattern == expression else None
+    if pattern.__class__ is not expression.__class__:
+        return None
+    return match_all(pattern.subexpressions, expression.subexpressions, bindings)
+
+def match_all(patterns, expressions, bindings):
+    if len(patterns) != len(expressions):
+        return None
+    for pattern, expression in zip(patterns, expressions):
+        bindings = match(pattern, expression, bindings)
+        if bindings is None:
+            return None
+    return bindings
+
+def instantiate(template, bindings):
+    "Substitutes the pattern variables in 'template' by their bound values"
+    if isinstance(template, Wild):
+        return bindings[template.name]
+    subexpressions = template.subexpressions
+    if not subexpressions:
+        return template
+    return template.__class__(*(instantiate(sub, bindings) for sub in subexpressions))
+
+class Rule:
+    """
+    Rewrites head(*arguments) to 'replacement'. If 'arguments' is None, the rule applies to
+    nodes of any arity. A callable replacement or condition is called with the matched
+    expression and the pattern variable bindings as keyword arguments. If 'version' is
+    given, it identifies the rule in RULES.fingerprint instead of its parts, and it must be
+    given if those cannot be described independently of the process, e.g. callable objects
+    other than plain functions.
+    """
+    def __init__(self, head, arguments, replacement, condition=None, version=None):
+        self.head = head
+        self.arguments = None if arguments is None else tuple(arguments)
+        self.arity = None if arguments is None else len(self.arguments)
+        self.replacement = replacement
+        self.condition = condition
+        self.version = version
+        self._checks, self._wilds = [], []
+        for idx, pattern in enumerate(self.arguments or ()):
+            if isinstance(pattern, Wild):
+                self._wilds.append((idx, pattern.name))
+                if pattern.kind:
+                    self._checks.append((idx, pattern.kind, None, None))
+            elif isinstance(pattern, Constant):
+                self._checks.append((idx, Constant, "value", pattern.value))
+            elif isinstance(pattern, Variable):
+                self._checks.append((idx, Variable, "name", pattern.name))
+            else:
+                self._checks.append((idx, pattern.__class__, None, None))
+        # Arguments consisting of distinct pattern variables and constants are fully matched
+        # by the checks alone
+        names = [name for _, name in self._wilds]
+        self._linear = len(set(names)) == len(names) and all(
+            isinstance(pattern, (Wild, Constant, Variable)) for pattern in self.arguments or ())
+    def admits(self, subexpressions):
+        "Cheap necessary condition for the rule to match arguments 'subexpressions'"
+        for idx, kind, attribute, value in self._checks:
+            sub = subexpressions[idx]
+            if not isinstance(sub, kind) or attribute and getattr(sub, attribute) != value:
+                return False
+        return True
+    def apply(self, expression, subexpressions=None, admitted=False):
+        """
+        Returns the rewritten expression or None if the rule does not apply. 'admitted'
+        skips the checks of admits if they have been done already.
+        """
+        bindings = {}
+        if self.arguments is not None:
+            if subexpressions is None:
+                subexpressions = expression.subexpressions
+            if len(subexpressions) != self.arity:
+                return None
+            if not admitted and not self.admits(subexpressions):
+                return None
+            if self._linear:
+                bindings = {name: subexpressions[idx] for idx, name in self._wilds}
+            else:
+                bindings = match_all(self.arguments, subexpressions, bindings)
+                if bindings is None:
+                    return None
+        if self.condition and not self.condition(expression, **bindings):
+            return None
+        if isinstance(self.replacement, Expression):
+            return instantiate(self.replacement, bindings)
+        return self.replacement(expression, **bindings)
+
+def _describe(item):
+    """
+    Returns a description of a rule or its parts, which does not depend on the process.
+    Functions are described by their code, including the constants, names and nested code
+    it refers to, and by the values of their default arguments and closure cells.
+    """
+    if isinstance(item, Rule):
+        if item.version is not None:
+            return ["Rule", _describe(item.head), _describe(item.version)]
+        return ["Rule", _describe(item.head), [_describe(pattern) for pattern in item.arguments]
+                if item.arguments is not None else None,
+                _describe(item.replacement), _describe(item.condition)]
+    if isinstance(item, Wild):
+        return ["Wild", item.name, _describe(item.kind)]
+    if isinstance(item, Constant):
+        return ["Constant", repr(item.value)]
+    if isinstance(item, Variable):
+        return ["Variable", item.name]
+    if isinstance(item, Expression):
+        return [_describe(item.__class__)] + [_describe(sub) for sub in item.subexpressions]
+    if item is None or isinstance(item, (bool, int, float, complex, str, bytes)):
+        return repr(item)
+    if isinstance(item, (tuple, list)):
+        return [_describe(element) for element in item]
+    if isinstance(item, (set, frozenset)):
+        return sorted(repr(_describe(element)) for element in item)
+    if isinstance(item, dict):
+        return sorted(repr([_describe(key), _describe(value)]) for key, value in item.items())
+    if isinstance(item, types.CodeType):
+        return [hashlib.sha256(item.co_code).hexdigest(), _describe(item.co_consts),
+                list(item.co_names), list(item.co_varnames)]
+    if isinstance(item, types.FunctionType):
+        cells = [cell.cell_contents for cell in item.__closure__ or ()]
+        return [f"{item.__module__}.{item.__qualname__}", _describe(item.__code__),
+                _describe(item.__defaults__), _describe(item.__kwdefaults__), _describe(cells)]
+    if isinstance(item, (type, types.BuiltinFunctionType)):
+        return f"{item.__module__}.{item.__qualname__}"
+    raise ValueError(f"Cannot describe {item!r} independently of the process, "
+                     "give its rule a version")
+
+class RuleSet:
+    """
+    Collection of rewrite rules indexed by head class and arity. Registering a rule replaces
+    the rule list and index instead of modifying them, so concurrent lookups are safe.
+    """
+    def __init__(self):
+        self._rules = ()
+        self._index = {}
+        self._fingerprint = ((), None)
+        self._lock = threading.Lock()
+    def register(self, rule):
+        with self._lock:
+            self._rules = self._rules + (rule,)
+            self._index = {}
+        return rule
+    @property
+    def fingerprint(self):
+        """
+        Hex digest identifying the registered rules, which is the same in every process with
+        the same rules, e.g. to invalidate persistently cached results when the rules change.
+        Rules with a version are identified by it, other callables by name and code.
+        """
+        rules, digest = self._fingerprint
+        if rules is not self._rules:
+            rules = self._rules
+            description = repr([_describe(rule) for rule in rules])
+            digest = hashlib.sha256(description.encode()).hexdigest()
+            self._fingerprint = (rules, digest)
+        return digest
+    def lookup(self, expression, subexpressions=None):
+        "Returns the rules applicable to nodes of the type and arity of 'expression'"
+        if subexpressions is None:
+            subexpressions = expression.subexpressions
+        key = (expression.__class__, len(subexpressions))
+        index = self._index
+        rules = index.get(key)
+        if rules is None:
+            rules = index[key] = [rule for rule in self._rules
+                                  if issubclass(key[0], rule.head) and rule.arity in (None, key[1])]
+        return rules
+    def apply(self, expression):
+        "Applies the first matching rule at the root of 'expression' only"
+        budget = _BUDGET.get()
+        if budget is not None and not budget.visit():
+            return expression
+        subexpressions = expression.subexpressions
+        for rule in self.lookup(expression, subexpressions):
+            if rule.arguments is not None and not rule.admits(subexpressions):
+                continue
+            rewritten = rule.apply(expression, subexpressions, admitted=True)
+            if rewritten is not None:
+                if budget is not None and rewritten is not expression:
+                    budget.steps += 1
+                return rewritten
+        return expression
+
+RULES = RuleSet()
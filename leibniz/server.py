@@ -0,0 +1,139 @@
+"""
+This module provides a long-running Leibniz server speaking a JSON-lines protocol over a local
+TCP or Unix socket. Requests are accepted by an asyncio front end and handled by a pool of
+worker processes, each holding its own warm parser.
+
+Every request is a single line of JSON such as
+
+    {"id": 1, "op": "differentiate", "expr": "x^2 * y", "variable": "x", "format": "py"}
+
+and is answered by a single line {"id": 1, "result": ...} or {"id": 1, "error": ...}.
+Supported operations are "parse", "simplify", "differentiate" and "evaluate". Variable
+assignments (x := 2) are remembered per client connection.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from .base import Constant, partial
+from .compiler import compile_expression
+from .equations import Assertion
+from .formatting import FSTRINGS
+from .parsing import Parser, tree_parser
+from .session import Session
+
+def _init_worker():
+    tree_parser()
+
+def _parse(source, session):
+    return Parser(session, commands=False).parse(source)
+
+@lru_cache(maxsize=1024)
+def _compile(source):
+    "Parses, simplifies and compiles 'source' into a Python function, cached per worker"
+    expression = _parse(source, Session()).simplify()
+    names = sorted(expression.variables)
+    return names, compile_expression(expression, names)
+
+def _constant_vars(variables):
+    environment = {}
+    for name, value in variables.items():
+        value = value.simplify()
+        if isinstance(value, Constant):
+            environment[name] = value.value
+    return environment
+
+def _handle(request, variables):
+    """
+    Runs a single request inside a worker process and returns the response along with the
+    updated session vars. Errors are reported in the response, since arbitrary exceptions
+    (e.g. from lark) do not necessarily survive the trip back to the front end. This includes
+    results which cannot be serialized as JSON, such as complex numbers.
+    """
+    try:
+        result, variables = _run(request, variables)
+        json.dumps(result)
+        return {"id": request.get("id"), "result": result}, variables
+    except Exception as exception:                                          # pylint: disable=broad-except
+        return {"id": request.get("id"), "error": f"{type(exception).__name__}: {exception}"}, \
+               variables
+
+def _run(request, variables):
+    session = Session()
+    session.vars().update(variables)
+    operation = request.get("op", "simplify")
+    source = request["expr"]
+    fstring = FSTRINGS[request.get("format", "plain")]
+    if operation == "evaluate":
+        environment = _constant_vars(session.vars())
+        environment.update(request.get("environment", {}))
+        names, function = _compile(source)
+        return function(*(environment[name] for name in names)), session.vars()
+    expression = _parse(source, session)
+    if operation == "parse":
+        result = expression
+    elif operation == "simplify":
+        result = expression.simplify()
+    elif operation == "differentiate":
+        if isinstance(expression, Assertion):
+            expression = expression.value
+        result = partial(expression, request["variable"])
+    else:
+        raise ValueError(f"Unknown operation '{operation}'")
+    return fstring.format(result), session.vars()
+
+class Server:
+    "Serves Leibniz requests to many clients from one pool of warm worker processes"
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+    async def handle_client(self, reader, writer):
+        "Handles one client connection, which owns its own session"
+        loop = asyncio.get_running_loop()
+        session = Session()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request must be a JSON object")
+                except ValueError as exception:
+                    response = {"id": None, "error": f"{type(exception).__name__}: {exception}"}
+                else:
+                    response, variables = await loop.run_in_executor(
+                        self.pool, _handle, request, session.vars())
+                    session.vars().update(variables)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+    async def serve(self, host="127.0.0.1", port=8765, path=None):
+        "Runs the server until cancelled, on a Unix socket if 'path' is given"
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker) as self.pool:
+            if path:
+                server = await asyncio.start_unix_server(self.handle_client, path=path)
+            else:
+                server = await asyncio.start_server(self.handle_client, host, port)
+            async with server:
+                await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m leibniz serve",
+                                     description="Run a Leibniz JSON-lines server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(Server(args.workers).serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        print("\nGoodbye!")
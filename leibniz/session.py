@@ -16,6 +16,7 @@ class Session:
     def __init__(self):
         self._vars = {}
         self._format = "tree"
+        self._parser = None
     def vars(self):
         return self._vars
     @property
@@ -26,11 +27,16 @@ class Session:
         "Leibniz REPL"
         user_input = input('> ')
         if user_input:
-            from .parsing import parse
-            leibniz_expr = parse(user_input)
+            leibniz_expr = self.parse(user_input)
             if leibniz_expr:
                 simplified = leibniz_expr.simplify()
                 print(FSTRINGS[self.format].format(simplified))
+    def parse(self, text):
+        "Parses 'text' within this session"
+        if self._parser is None:
+            from .parsing import PARSER, SESSION, Parser
+            self._parser = PARSER if self is SESSION else Parser(self)
+        return self._parser.parse(text)
     def python(self):
         "Drops into a Python REPL"
         from code import InteractiveConsole
@@ -0,0 +1,65 @@
+"""
+Stress tests for using Leibniz from many threads at once. A tiny switch interval makes the
+interpreter switch threads as often as possible, so that races on shared expression nodes or
+parser state show up as results differing from a serial run.
+"""
+
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from leibniz import parse, Parser
+from leibniz.base import partial
+
+SOURCES = [
+    "x * y + Sin(x * y) - (x + 1) / (y + 2)",
+    "(x + 1) * (x + 2) * (x + 3) * (y + 4) / (Sin(x) + Cos(y * y / 2))",
+    "Exp(x) * Exp(2 * y) * x^3 + Ln(x * x + 1)",
+    " + ".join(f"(x^{i % 4} * y) / (x + y + {i})" for i in range(1, 16)),
+    "(x - y)^2 - (x + y)^2 + 4 * x * y",
+    "Sqrt(x^2 + y^2) * Atan(y / x) - Tanh(x - y)",
+]
+
+WORKERS = 8
+ROUNDS = 20
+
+def _derive(expression):
+    "Everything computed from a shared expression, in printable form"
+    simplified = expression.simplify()
+    return (str(simplified), str(partial(expression, "x")), str(partial(simplified, "y")),
+            str(partial(partial(expression, "x"), "y")))
+
+def _parse_in_session(index):
+    "Parses with a private parser, defining a session variable of its own"
+    parser = Parser()
+    parser.parse(f"a{index} := {index} * x")
+    expression = parser.parse(SOURCES[index % len(SOURCES)])
+    return sorted(parser.session.vars()), str(expression), _derive(expression)
+
+class ConcurrencyTest(unittest.TestCase):
+    "Runs the same work serially and on a thread pool and compares the results"
+    def setUp(self):
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.shared = [parse(source) for source in SOURCES]
+        self.before = [repr(expression) for expression in self.shared]
+        self.serial = [_derive(expression) for expression in self.shared]
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+    def test_shared_expressions(self):
+        tasks = [expression for _ in range(ROUNDS) for expression in self.shared]
+        with ThreadPoolExecutor(WORKERS) as executor:
+            results = list(executor.map(_derive, tasks))
+        self.assertEqual(results, self.serial * ROUNDS)
+        self.assertEqual([repr(expression) for expression in self.shared], self.before)
+    def test_independent_parsers(self):
+        indices = range(ROUNDS * len(SOURCES))
+        with ThreadPoolExecutor(WORKERS) as executor:
+            results = list(executor.map(_parse_in_session, indices))
+        for index, (variables, expression, derived) in zip(indices, results):
+            self.assertEqual(variables, [f"a{index}"])
+            self.assertEqual(expression, str(self.shared[index % len(SOURCES)]))
+            self.assertEqual(derived, self.serial[index % len(SOURCES)])
+        self.assertEqual([repr(expression) for expression in self.shared], self.before)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Round trips of requests through a Leibniz server listening on a Unix socket, with a single
+worker process.
+"""
+
+import asyncio
+import json
+import math
+import os
+import tempfile
+import unittest
+from leibniz.server import Server
+
+REQUESTS = [
+    {"id": 1, "op": "parse", "expr": "x * (y + 1)"},
+    {"id": 2, "op": "simplify", "expr": "x * 1 + 2 * 3 + 0"},
+    {"id": 3, "op": "differentiate", "expr": "x^2 * y", "variable": "x", "format": "py"},
+    {"id": 4, "op": "evaluate", "expr": "Sin(x)", "environment": {"x": 1}},
+    {"id": 5, "op": "evaluate", "expr": "Sqrt(x) + 0", "environment": {"x": 4}},
+    {"id": 6, "op": "simplify", "expr": "a := 2"},
+    {"id": 7, "op": "evaluate", "expr": "a * x + y", "environment": {"x": 3, "y": 1}},
+    {"id": 8, "op": "evaluate", "expr": "(-1)^0.5"},
+    {"id": 9, "op": "integrate", "expr": "x"},
+]
+
+async def _exchange(requests):
+    "Sends 'requests' over one connection to a fresh server and returns the responses"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "leibniz.sock")
+        task = asyncio.create_task(Server(workers=1).serve(path=path))
+        try:
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            reader, writer = await asyncio.open_unix_connection(path)
+            responses = []
+            for request in requests:
+                writer.write(json.dumps(request).encode() + b"\n")
+                await writer.drain()
+                responses.append(json.loads(await reader.readline()))
+            writer.close()
+            return responses
+        finally:
+            task.cancel()
+
+class ServerTest(unittest.TestCase):
+    "Checks every operation, session vars and the reporting of errors"
+    @classmethod
+    def setUpClass(cls):
+        responses = asyncio.run(asyncio.wait_for(_exchange(REQUESTS), 60))
+        cls.responses = {response["id"]: response for response in responses}
+    def test_parse(self):
+        self.assertEqual(self.responses[1], {"id": 1, "result": "x * (y + 1.0)"})
+    def test_simplify(self):
+        self.assertEqual(self.responses[2], {"id": 2, "result": "6.0 + x"})
+    def test_differentiate(self):
+        self.assertEqual(self.responses[3], {"id": 3, "result": "2.0 * x * y"})
+    def test_evaluate(self):
+        self.assertAlmostEqual(self.responses[4]["result"], math.sin(1))
+        self.assertAlmostEqual(self.responses[5]["result"], 2)
+    def test_session(self):
+        self.assertAlmostEqual(self.responses[7]["result"], 7)
+    def test_errors(self):
+        self.assertIn("error", self.responses[8])
+        self.assertEqual(self.responses[9]["error"], "ValueError: Unknown operation 'integrate'")
+
+if __name__ == "__main__":
+    unittest.main()